@@ -0,0 +1,108 @@
+"""
+Load script for /api/upload/: sends concurrent PNG uploads to a running
+server and reports upload throughput, plus the latency of a light GET
+made while the uploads are in flight
+
+Usage (server started separately with `python app.py` from src/):
+    python scripts/bench_upload.py --url http://localhost:8000
+"""
+import argparse
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import statistics
+import struct
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+
+def make_png(width, height):
+    """
+    Build an RGB PNG of random noise, which barely compresses
+    """
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    row = width * 3
+    noise = os.urandom(row * height)
+    raw = b"".join(b"\x00" + noise[y * row:(y + 1) * row] for y in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+def post_upload(url, body):
+    """
+    Send one upload and return its status code
+    """
+    req = urllib.request.Request(
+        f"{url}/api/upload/", data=body, method="POST",
+        headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(req) as res:
+            return res.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--uploads", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1600, help="image width and height")
+    args = parser.parse_args()
+
+    png = make_png(args.size, args.size)
+    body = json.dumps({
+        "image_data": "data:image/png;base64," + base64.b64encode(png).decode()
+    }).encode()
+    print(f"{args.uploads} uploads of {len(body) / 1e6:.1f} MB, {args.concurrency} concurrent")
+
+    stop = threading.Event()
+    latencies = []
+    ping_errors = []
+
+    def ping():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(f"{args.url}/api/tags/").read()
+                latencies.append(time.perf_counter() - start)
+            except (urllib.error.URLError, OSError) as e:
+                ping_errors.append(e)
+            time.sleep(0.05)
+
+    pinger = threading.Thread(target=ping)
+    start = time.perf_counter()
+    pinger.start()
+    with ThreadPoolExecutor(args.concurrency) as ex:
+        codes = list(ex.map(lambda _: post_upload(args.url, body), range(args.uploads)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    pinger.join()
+
+    latencies.sort()
+    print(f"status codes: { {c: codes.count(c) for c in set(codes)} }")
+    print(f"throughput: {args.uploads / elapsed:.2f} uploads/s ({elapsed:.1f}s)")
+    if latencies:
+        print(
+            f"GET /api/tags/ during uploads: p50 {statistics.median(latencies) * 1e3:.0f} ms, "
+            f"max {latencies[-1] * 1e3:.0f} ms ({len(latencies)} requests, "
+            f"{len(ping_errors)} failed)"
+        )
+    else:
+        print(f"GET /api/tags/ during uploads: all {len(ping_errors)} requests failed")
+
+
+if __name__ == "__main__":
+    main()
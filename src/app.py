@@ -1,5 +1,7 @@
 from db import db, User, Post, Tag, Asset
 from flask import Flask, request
+from images import ImageTooLarge, MAX_REQUEST_BYTES
+import click
 import json
 import os
 from data import add_data
@@ -11,20 +13,40 @@ db_filename = "savvy.db"
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///%s" % db_filename
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SQLALCHEMY_ECHO"] = False
+#reject oversized uploads before the body is read and parsed
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
 
 db.init_app(app)
-with app.app_context():
+
+
+def init_db():
+    """
+    Create the tables and seed posts from data.json if there are none yet
+    """
     db.create_all()
-    if len(Post.query.all()) == 0:
+    if not db.session.query(Post.query.exists()).scalar():
         add_data(FILE_NAME)
 
 
+@app.cli.command("init-db")
+def init_db_command():
+    """
+    One-time setup: run `flask --app app init-db` before starting the server
+    """
+    init_db()
+    click.echo("Initialized the database")
+
+
 def success_response(body, code=200):
     return json.dumps(body), code
 
 def failure_response(msg, code=404):
     return json.dumps({"Error": msg}), code
 
+@app.errorhandler(413)
+def request_too_large(e):
+    return failure_response("Request body is too large", 413)
+
 @app.route("/")
 def welcome():
     """
@@ -275,7 +297,14 @@ def upload():
         return failure_response("No Base64 URL")
     
     #create new Asset object
-    asset = Asset(image_data=image_data)
+    try:
+        asset = Asset(image_data=image_data)
+    except ImageTooLarge as e:
+        return failure_response(str(e), 413)
+    except ValueError as e:
+        return failure_response(str(e), 400)
+    except Exception:
+        return failure_response("Could not upload image", 500)
     db.session.add(asset)
     db.session.commit()
 
@@ -1,14 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
-import base64
-import boto3
 import datetime
-import io
-from io import BytesIO
-from mimetypes import guess_extension, guess_type
 import os
-from PIL import Image
 import random
-import re
 import string
 
 db = SQLAlchemy()
@@ -282,13 +275,20 @@ class Asset(db.Model):
             1. Rejects the image if it's not supported filetype
             2. Generates a random string for the image filename
             3. Decodes the image and attempts to upload it to AWS
+        Rejected images raise a ValueError, any other failure is re-raised
         """
+        #the mimetypes and image pool modules are only needed on upload
+        from mimetypes import guess_extension, guess_type
+        from images import InvalidImage, process_image, split_data_url
+
         try:
-            ext = guess_extension(guess_type(image_data)[0])[1:]
+            #check the header and payload size before decoding anything
+            header, payload = split_data_url(image_data)
+            ext = (guess_extension(guess_type(f"{header},")[0]) or ".")[1:]
 
             #only accept supported file extension
             if ext not in EXTENSIONS:
-                raise Exception(f"Extention {ext} not supported")
+                raise InvalidImage(f"Extention {ext} not supported")
             
             #securely generate a random string for image name
             salt = "".join(
@@ -298,32 +298,37 @@ class Asset(db.Model):
                 for _ in range(16)
             )
 
-            #remove base64 header
-            img_str = re.sub("^data:image/.+;base64,", "", image_data)
-            img_data = base64.b64decode(img_str)
-            img = Image.open(BytesIO(img_data))
+            #decode, validate and save the image in the process pool
+            img_filename = f"{salt}.{ext}"
+            img_temploc = f"{BASE_DIR}/{img_filename}"
+            try:
+                width, height = process_image(payload, ext, img_temploc)
+                self.upload(img_temploc, img_filename)
+            finally:
+                #remove image from server
+                if os.path.exists(img_temploc):
+                    os.remove(img_temploc)
 
             self.base_url = S3_BASE_URL
             self.salt = salt
             self.extension = ext
-            self.width = img.width
-            self.height = img.height
+            self.width = width
+            self.height = height
             self.created_at = datetime.datetime.now()
-
-            img_filename = f"{self.salt}.{self.extension}"
-            self.upload(img, img_filename)
+        except ValueError:
+            #rejected images are reported back to the client by the route
+            raise
         except Exception as e:
             print(f"Error while creating image: {e}")
+            raise
 
-    def upload(self, img, img_filename):
+    def upload(self, img_temploc, img_filename):
         """
         Attempt to upload the image into S3 bucket
         """
-        try:
-            #save image temporarily on the server
-            img_temploc = f"{BASE_DIR}/{img_filename}"
-            img.save(img_temploc)
+        import boto3
 
+        try:
             #upload the image to S3
             s3_client = boto3.client("s3")
             s3_client.upload_file(img_temploc, S3_BUCKET_NAME, img_filename)
@@ -333,10 +338,8 @@ class Asset(db.Model):
             object_acl = s3_resource.ObjectAcl(S3_BUCKET_NAME, img_filename)
             object_acl.put(ACL="public-read")
 
-            #remove image from server
-            os.remove(img_temploc)
-
         except Exception as e:
             print(f"Error while uploading image: {e}")
+            raise
 
     
\ No newline at end of file
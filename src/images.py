@@ -0,0 +1,195 @@
+"""
+Image decoding and validation for uploads, run in a bounded process pool
+so large images don't hold the GIL on the request thread
+"""
+from contextlib import contextmanager
+import os
+import re
+import threading
+
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", 10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 25_000_000))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", os.cpu_count() or 1))
+#keep this below the size of /dev/shm, see shm_size in docker-compose.yml
+IMAGE_SHM_BYTES = int(os.environ.get("IMAGE_SHM_BYTES", 48 * 1024 * 1024))
+IMAGE_TIMEOUT = float(os.environ.get("IMAGE_TIMEOUT", 30))
+#largest request body an upload of MAX_IMAGE_BYTES can need once base64
+#encoded and wrapped in JSON
+MAX_REQUEST_BYTES = MAX_IMAGE_BYTES * 4 // 3 + 64 * 1024
+
+FORMATS = {"png": "PNG", "gif": "GIF", "jpg": "JPEG", "jpeg": "JPEG"}
+HEADER_PATTERN = re.compile(r"data:image/[\w.+-]+;base64")
+
+_pool = None
+_pool_lock = threading.Lock()
+_shm_in_use = 0
+_shm_freed = threading.Condition()
+
+
+class InvalidImage(ValueError):
+    """
+    Raised when an uploaded image is malformed or not a supported format
+    """
+
+
+class ImageTooLarge(ValueError):
+    """
+    Raised when an uploaded image is over the configured size limits
+    """
+
+
+def split_data_url(image_data):
+    """
+    Split a base64 data URL into its header and payload, checking the
+    header and the payload size before anything is decoded
+    """
+    header, sep, payload = image_data.partition(",")
+    if not sep or not HEADER_PATTERN.fullmatch(header):
+        raise InvalidImage("Invalid base64 image header")
+    if not payload:
+        raise InvalidImage("Empty image data")
+    if len(payload) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    return header, payload
+
+
+@contextmanager
+def reserve_shm(size):
+    """
+    Wait until size more bytes fit in the shared memory budget, then hold
+    them until the block exits. Filling /dev/shm crashes the server with
+    SIGBUS instead of raising, so this is counted in bytes, not uploads
+    """
+    global _shm_in_use
+    with _shm_freed:
+        #a payload bigger than the whole budget may still run on its own
+        _shm_freed.wait_for(
+            lambda: _shm_in_use == 0 or _shm_in_use + size <= IMAGE_SHM_BYTES
+        )
+        _shm_in_use += size
+    try:
+        yield
+    finally:
+        with _shm_freed:
+            _shm_in_use -= size
+            _shm_freed.notify_all()
+
+
+def get_pool():
+    """
+    Return the image process pool, starting it on first use
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            #never fork the threaded server: workers are forked from a
+            #single-threaded forkserver, or spawned where there is none
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context("forkserver")
+            else:
+                ctx = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=ctx)
+        return _pool
+
+
+def reset_pool(pool):
+    """
+    Drop a broken or stuck pool so the next upload starts a new one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    #the executor has no public way to stop a hung worker, so terminate them
+    for process in list(pool._processes.values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def process_image(payload, ext, img_temploc):
+    """
+    Decode and validate a base64 image payload in the process pool and
+    save it to img_temploc. The payload is handed over through shared
+    memory rather than pickled. Returns the image's (width, height)
+    """
+    from concurrent.futures import TimeoutError
+    from concurrent.futures.process import BrokenProcessPool
+    from multiprocessing import shared_memory
+
+    #base64 is ascii, so the encoded payload is exactly len(payload) bytes
+    size = len(payload)
+    with reserve_shm(size):
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            try:
+                shm.buf[:size] = payload.encode("ascii")
+            except UnicodeEncodeError:
+                raise InvalidImage("Invalid base64 image data")
+            pool = get_pool()
+            future = pool.submit(_decode_image, shm.name, size, ext, img_temploc)
+            try:
+                return future.result(timeout=IMAGE_TIMEOUT)
+            except TimeoutError:
+                future.cancel()
+                reset_pool(pool)
+                raise TimeoutError(f"Image took longer than {IMAGE_TIMEOUT}s to process")
+            except BrokenProcessPool:
+                reset_pool(pool)
+                raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+def _decode_image(shm_name, size, ext, img_temploc):
+    """
+    Worker: decode the payload in shared memory, check its format against
+    ext and its dimensions, then re-encode it to img_temploc
+    """
+    import binascii
+    from io import BytesIO
+    from multiprocessing import shared_memory
+    from PIL import Image
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buf = shm.buf[:size]
+    try:
+        img_data = binascii.a2b_base64(buf)
+    except binascii.Error:
+        raise InvalidImage("Invalid base64 image data")
+    finally:
+        buf.release()
+        shm.close()
+
+    if len(img_data) > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+
+    #MAX_IMAGE_PIXELS below replaces Pillow's own decompression bomb check
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        #Image.open only reads the header, so check dimensions before decoding
+        img = Image.open(BytesIO(img_data))
+        if img.format != FORMATS.get(ext):
+            raise InvalidImage(f"Image data is {img.format}, not {ext}")
+        if img.width * img.height > MAX_IMAGE_PIXELS:
+            raise ImageTooLarge(f"Image has more than {MAX_IMAGE_PIXELS} pixels")
+        img.verify()
+
+        #verify() leaves the image unusable, so reopen it to re-encode
+        img = Image.open(BytesIO(img_data))
+        img.load()
+
+        #encode in memory first so encoder errors aren't mistaken for disk errors
+        out = BytesIO()
+        img.save(out, format=img.format)
+    except (InvalidImage, ImageTooLarge):
+        raise
+    except (OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(f"Invalid image data: {e}")
+
+    with open(img_temploc, "wb") as f:
+        f.write(out.getbuffer())
+    return img.width, img.height